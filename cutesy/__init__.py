@@ -1,20 +1,21 @@
 """Lint & autoformat an HTML document in Python."""
 # Standard Library
+import io
+import operator
 import re
 import string
+from bisect import bisect_left
+from collections import Counter
 from dataclasses import dataclass
 from enum import Enum, auto, unique
+from functools import lru_cache, partial
 from html.parser import HTMLParser
+from types import MappingProxyType
 
 # Third Party
 from data_enum import DataEnum
 
 
-def is_whitespace(char):
-    """Return whether char is a whitespace character."""
-    return char in string.whitespace
-
-
 class DoctypeError(Exception):
     """An error that can be raised when encountering a non-HTML5 doctype."""
 
@@ -81,6 +82,16 @@ Rule("E3", "Left angle bracket not represented as “&lt;”")
 Rule("E4", "Right angle bracket not represented as “&gt;”")
 
 
+@lru_cache(maxsize=None)
+def get_rule(rule_code):
+    """Return the rule for a code, caching the lookup.
+
+    Rule.get() searches all of the members each time, and errors are logged
+    often enough for that to show up.
+    """
+    return Rule.get(rule_code)
+
+
 class Mode(DataEnum):
     """A state to represent the structure of the HTML."""
 
@@ -128,6 +139,237 @@ VOID_ELEMENTS = frozenset(
     ),
 )
 
+# The kinds of markup that can follow "<", told apart in a single match
+TAG_OPEN_REGEX = re.compile(
+    r"<(?:(?P<start>[a-zA-Z])|(?P<end>/[a-zA-Z])|(?P<comment>!--)|(?P<declaration>!))",
+)
+
+# Patterns for parsing tags, adapted from:
+# https://github.com/python/cpython/blob/3.10/Lib/html/parser.py
+ATTRFIND_TOLERANT_REGEX = re.compile(
+    r'((?<=[\'"\s/])[^\s/>][^\s/=>]*)(\s*=+\s*'
+    + r'(\'[^\']*\'|"[^"]*"|(?![\'"])[^>\s]*))?(?:\s|/(?!>))*',
+)
+TAGFIND_TOLERANT_REGEX = re.compile(r"([a-zA-Z][^\t\n\r\f />\x00]*)(?:\s|/(?!>))*")
+ENDTAGFIND_REGEX = re.compile(r"</([a-zA-Z][-.a-zA-Z0-9:_]*)\s*>")
+CHARACTER_REFERENCE_REGEX = re.compile(
+    r"&(?:#(?P<charref>[0-9]+|[xX][0-9a-fA-F]+)|(?P<entityref>[a-zA-Z][-.a-zA-Z0-9]*));",
+)
+
+
+@lru_cache(maxsize=None)
+def get_overlap_regexes(delimiter):
+    """Return the start & end tag patterns that overlap a given delimiter."""
+    delimiter_regex = re.escape(delimiter)
+    return (
+        re.compile(rf"<([a-zA-Z][-.a-zA-Z0-9:_]*){delimiter_regex}"),
+        re.compile(rf"</[a-zA-Z][-.a-zA-Z0-9:_]*\s*{delimiter_regex}"),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_interesting_regex(delimiter):
+    """Return the pattern for characters that start markup or an instruction.
+
+    The interesting characters are all single characters, so the tokenizer
+    can dispatch on the character found instead of probing the raw data again
+    for each kind of token.
+    """
+    delimiter_regex = re.escape(delimiter) if delimiter else ""
+    return re.compile(f"[&<{delimiter_regex}]")
+
+
+# Line breaks, for finding positions in the raw data
+LINE_BREAK_REGEX = re.compile("\n")
+
+# Patterns for normalizing whitespace in data & attributes
+TRAILING_WHITESPACE_REGEX = re.compile(r"[ \t]+\n")
+EXTRA_VERTICAL_LINES_REGEX = re.compile(r"\n{3,}")
+WRAPPED_WHITESPACE_REGEX = re.compile(r"\s*\n\s*")
+
+# Horizontal whitespace other than a single space, which comes before some
+# content on the same line and follows either content or the start of the data
+EXTRA_HORIZONTAL_WHITESPACE_REGEX = re.compile(
+    r"(?:\A|(?<=\S))(?:[^\S\n]{2,}|[^\S \n])(?=\S)",
+)
+
+# Whitespace which str.split() & " ".join() would change
+NONCANONICAL_WHITESPACE_REGEX = re.compile(r"\A\s|\s\Z|\s\s|[^\S ]")
+
+# Everything other than the characters in string.whitespace
+NON_WHITESPACE_REGEX = re.compile(f"[^{re.escape(string.whitespace)}]+")
+WHITESPACE_DELETION_TABLE = str.maketrans("", "", string.whitespace)
+
+# Line breaks (with the whitespace around them), or horizontal whitespace
+# other than a single space
+DATA_WHITESPACE_REGEX = re.compile(
+    r"(?P<newlines>[ \t]*(?:\n[ \t]*)+)(?P<line_start>[^\S\n]*)|[^\S\n]{2,}|[^\S \n]",
+)
+
+
+def _replace_data_whitespace(html_data, indentation, match):
+    """Return the replacement for a DATA_WHITESPACE_REGEX match in the HTML."""
+    newlines = match.group("newlines")
+    if newlines is None:
+        # Extra horizontal whitespace
+        return " "
+
+    line_start = match.group("line_start")
+    if line_start:
+        end = match.end()
+        if end < len(html_data) and html_data[end] == "\n":
+            # Trailing whitespace on a line with no content
+            line_start = line_start.rstrip(" \t")
+
+    line_breaks = "\n" * min(newlines.count("\n"), 2)
+    return f"{line_breaks}{indentation}{line_start}"
+
+
+def collapse_whitespace(text):
+    """Return text with whitespace runs as single spaces, and trimmed."""
+    if not NONCANONICAL_WHITESPACE_REGEX.search(text):
+        # Already collapsed; Skip building the list of words
+        return text
+
+    return " ".join(text.split())
+
+
+# Attribute names in priority order. Strings match a name exactly, while
+# ("in", text) matches names containing text and ("startswith", text) matches
+# names starting with text.
+ATTR_PRIORITIES = (
+    "⚡",
+    "amp",
+    "lang",
+    "rel",
+    "as",
+    "for",
+    "type",
+    "id",
+    "class",
+    ("in", "class"),
+    "name",
+    ("in", "href"),
+    "itemid",
+    "itemscope",
+    "itemtype",
+    "itemprop",
+    "property",
+    "content",
+    "value",
+    ("in", "value"),
+    "placeholder",
+    "checked",
+    ("in", "checked"),
+    "href",
+    "src",
+    ("in", "src"),
+    "multiple",
+    "size",
+    "step",
+    "sizes",
+    "width",
+    "height",
+    "alt",
+    "title",
+    "pattern",
+    "maxlength",
+    "disabled",
+    "hidden",
+    ("in", "hidden"),
+    "readonly",
+    "required",
+    "autocomplete",
+    "autofocus",
+    "tabindex",
+    ("startswith", "form"),
+    "itemid",
+    "itemscope",
+    "itemtype",
+    "itemprop",
+    "style",
+)
+
+# Attribute name prefixes which push attributes to the end, in order
+ATTR_DEPRIORITIZED_PREFIXES = ("on", "data-")
+
+
+def _matches_attr_priority(name, priority):
+    if isinstance(priority, str):
+        return name == priority
+
+    operation, text = priority
+    if operation == "in":
+        return text in name
+
+    return name.startswith(text)
+
+
+def _make_attr_sort_mask(name):
+    """Return an integer ranking an attribute name by priority.
+
+    Each priority (and deprioritized prefix) contributes one bit, most
+    significant first, so that comparing masks is equivalent to comparing
+    the matches in priority order. Lower masks sort first.
+    """
+    mask = 0
+    for priority in ATTR_PRIORITIES:
+        mask = (mask << 1) | (not _matches_attr_priority(name, priority))
+    for prefix in ATTR_DEPRIORITIZED_PREFIXES:
+        mask = (mask << 1) | name.startswith(prefix)
+    return mask
+
+
+# Precomputed masks for the attribute names listed explicitly
+ATTR_SORT_MASKS = MappingProxyType(
+    {
+        priority: _make_attr_sort_mask(priority)
+        for priority in ATTR_PRIORITIES
+        if isinstance(priority, str)
+    },
+)
+
+# Any other name misses every exact match, so only the partial matches (and
+# deprioritized prefixes) need to be checked for it.
+UNKNOWN_ATTR_SORT_MASK = ((1 << len(ATTR_PRIORITIES)) - 1) << len(ATTR_DEPRIORITIZED_PREFIXES)
+ATTR_PARTIAL_PRIORITY_BITS = tuple(
+    (1 << (len(ATTR_PRIORITIES) + len(ATTR_DEPRIORITIZED_PREFIXES) - 1 - index), priority)
+    for index, priority in enumerate(ATTR_PRIORITIES)
+    if not isinstance(priority, str)
+)
+ATTR_DEPRIORITIZED_PREFIX_BITS = tuple(
+    (1 << (len(ATTR_DEPRIORITIZED_PREFIXES) - 1 - index), prefix)
+    for index, prefix in enumerate(ATTR_DEPRIORITIZED_PREFIXES)
+)
+
+
+def attr_sort(attr):
+    """Return a key to sort an attribute (or group of attributes) by name."""
+    name = attr[0]
+    if name is None:
+        # Keyless groups go last
+        return True, 0, ""
+
+    mask = ATTR_SORT_MASKS.get(name)
+    if mask is None:
+        mask = UNKNOWN_ATTR_SORT_MASK
+        for bit, priority in ATTR_PARTIAL_PRIORITY_BITS:
+            if _matches_attr_priority(name, priority):
+                mask ^= bit
+        for bit, prefix in ATTR_DEPRIORITIZED_PREFIX_BITS:
+            if name.startswith(prefix):
+                mask |= bit
+
+    return False, mask, name
+
+
+# Flags for the behavior of each InstructionType
+INSTRUCTION_GROUP_START = 1
+INSTRUCTION_GROUP_MIDDLE = 2
+INSTRUCTION_GROUP_END = 4
+INSTRUCTION_INCREASES_INDENTATION = 8
+INSTRUCTION_DECREASES_INDENTATION = 16
+
 
 @unique
 class InstructionType(Enum):
@@ -183,53 +425,74 @@ class InstructionType(Enum):
         """Match all (and only) the character values."""
         return "[a-k]"
 
+    @property
+    def flags(self):
+        """Return the INSTRUCTION_* flags which describe this instruction type.
+
+        Checking a flag is cheaper than the equivalent property, which is
+        useful in loops.
+        """
+        return INSTRUCTION_TYPE_FLAGS.get(self.value, 0)
+
     @property
     def is_group_start(self):
         """Whether this instruction type starts a linked group."""
-        return self in {
-            InstructionType.PARTIAL,
-            InstructionType.CONDITIONAL,
-            InstructionType.REPEATABLE,
-        }
+        return bool(self.flags & INSTRUCTION_GROUP_START)
 
     @property
     def is_group_middle(self):
         """Whether this instruction type continues a linked group."""
-        return self in {
-            InstructionType.MID_CONDITIONAL,
-            InstructionType.LAST_CONDITIONAL,
-        }
+        return bool(self.flags & INSTRUCTION_GROUP_MIDDLE)
 
     @property
     def is_group_end(self):
         """Whether this instruction type ends a linked group."""
-        return self in {
-            InstructionType.END_PARTIAL,
-            InstructionType.END_CONDITIONAL,
-            InstructionType.END_REPEATABLE,
-        }
+        return bool(self.flags & INSTRUCTION_GROUP_END)
 
     @property
     def increase_indentation(self):
         """Whether this instruction type causes an increase in indentation."""
-        return self in {
-            InstructionType.PARTIAL,
-            InstructionType.CONDITIONAL,
-            InstructionType.MID_CONDITIONAL,
-            InstructionType.LAST_CONDITIONAL,
-            InstructionType.REPEATABLE,
-        }
+        return bool(self.flags & INSTRUCTION_INCREASES_INDENTATION)
 
     @property
     def decrease_indentation(self):
         """Whether this instruction type causes a decrease in indentation."""
-        return self in {
-            InstructionType.END_PARTIAL,
-            InstructionType.MID_CONDITIONAL,
-            InstructionType.LAST_CONDITIONAL,
-            InstructionType.END_CONDITIONAL,
-            InstructionType.END_REPEATABLE,
-        }
+        return bool(self.flags & INSTRUCTION_DECREASES_INDENTATION)
+
+
+# Flags by InstructionType value; Instruction types without any are omitted
+INSTRUCTION_TYPE_FLAGS = MappingProxyType(
+    {
+        InstructionType.PARTIAL.value: (
+            INSTRUCTION_GROUP_START | INSTRUCTION_INCREASES_INDENTATION
+        ),
+        InstructionType.END_PARTIAL.value: (
+            INSTRUCTION_GROUP_END | INSTRUCTION_DECREASES_INDENTATION
+        ),
+        InstructionType.CONDITIONAL.value: (
+            INSTRUCTION_GROUP_START | INSTRUCTION_INCREASES_INDENTATION
+        ),
+        InstructionType.MID_CONDITIONAL.value: (
+            INSTRUCTION_GROUP_MIDDLE
+            | INSTRUCTION_INCREASES_INDENTATION
+            | INSTRUCTION_DECREASES_INDENTATION
+        ),
+        InstructionType.LAST_CONDITIONAL.value: (
+            INSTRUCTION_GROUP_MIDDLE
+            | INSTRUCTION_INCREASES_INDENTATION
+            | INSTRUCTION_DECREASES_INDENTATION
+        ),
+        InstructionType.END_CONDITIONAL.value: (
+            INSTRUCTION_GROUP_END | INSTRUCTION_DECREASES_INDENTATION
+        ),
+        InstructionType.REPEATABLE.value: (
+            INSTRUCTION_GROUP_START | INSTRUCTION_INCREASES_INDENTATION
+        ),
+        InstructionType.END_REPEATABLE.value: (
+            INSTRUCTION_GROUP_END | INSTRUCTION_DECREASES_INDENTATION
+        ),
+    },
+)
 
 
 class HTMLLinter(HTMLParser):
@@ -259,65 +522,8 @@ class HTMLLinter(HTMLParser):
         self.long_attr_value_length = 10
         self.xlong_attr_value_length = 28
         self.xxlong_attr_value_length = 60
-
         # A function to sort attributes by priority
-        self.attr_sort = lambda attr: (
-            attr[0] is None,
-            attr[0] != "⚡",
-            attr[0] != "amp",
-            attr[0] != "lang",
-            attr[0] != "rel",
-            attr[0] != "as",
-            attr[0] != "for",
-            attr[0] != "type",
-            attr[0] != "id",
-            attr[0] != "class",
-            "class" not in (attr[0] or ""),
-            attr[0] != "name",
-            "href" not in (attr[0] or ""),
-            attr[0] != "itemid",
-            attr[0] != "itemscope",
-            attr[0] != "itemtype",
-            attr[0] != "itemprop",
-            attr[0] != "property",
-            attr[0] != "content",
-            attr[0] != "value",
-            "value" not in (attr[0] or ""),
-            attr[0] != "placeholder",
-            attr[0] != "checked",
-            "checked" not in (attr[0] or ""),
-            attr[0] != "href",
-            attr[0] != "src",
-            "src" not in (attr[0] or ""),
-            attr[0] != "multiple",
-            attr[0] != "size",
-            attr[0] != "step",
-            attr[0] != "sizes",
-            attr[0] != "width",
-            attr[0] != "height",
-            attr[0] != "alt",
-            attr[0] != "title",
-            attr[0] != "pattern",
-            attr[0] != "maxlength",
-            attr[0] != "disabled",
-            attr[0] != "hidden",
-            "hidden" not in (attr[0] or ""),
-            attr[0] != "readonly",
-            attr[0] != "required",
-            attr[0] != "autocomplete",
-            attr[0] != "autofocus",
-            attr[0] != "tabindex",
-            not (attr[0] or "").startswith("form"),
-            attr[0] != "itemid",
-            attr[0] != "itemscope",
-            attr[0] != "itemtype",
-            attr[0] != "itemprop",
-            attr[0] != "style",
-            # Push these keys to the end
-            (attr[0] or "").startswith("on"),
-            (attr[0] or "").startswith("data-"),
-            attr[0],
-        )
+        self.attr_sort = attr_sort
 
     def reset(self):
         """Reset the state of the linter so that it can be run again."""
@@ -325,14 +531,20 @@ class HTMLLinter(HTMLParser):
 
         self._mode = None  # Full document or arbitrary HTML
 
+        # Error details, as (line, column, rule code, replacements) tuples;
+        # These become Error instances once linting finishes.
         self._errors = []
-        self._result = []
+        self._result = io.StringIO()
+
+        # Indentation strings by level, built as needed
+        self._indentations = [""]
 
         # Parsing state
         self._did_report_expected_doctype = False
         self._freeform_level = 0
         self._indentation_level = 0
         self._tag_stack = []
+        self._open_tag_counts = Counter()  # Tag names in self._tag_stack
 
         # Possible values: {None, True} if self.fix else {None, str}
         self._expected_indentation = None
@@ -341,6 +553,10 @@ class HTMLLinter(HTMLParser):
         self._line = 0
         self._column = 0
 
+        # Position in the raw data; Line & column are derived from it on demand
+        self._cursor = 0
+        self._line_break_offsets = None
+
     def lint(self, html):
         """Run the server-side-rendering routine."""
         self.reset()
@@ -362,8 +578,11 @@ class HTMLLinter(HTMLParser):
 
         self.close()
 
-        result = "".join(self._result) if self.fix else html_data
-        errors = self._errors
+        result = self._result.getvalue() if self.fix else html_data
+        errors = [
+            Error(line=line, column=column, rule=get_rule(rule_code), replacements=replacements)
+            for line, column, rule_code, replacements in self._errors
+        ]
 
         if self.preprocessor:
             # Restore the instructions into the placeholder slots
@@ -372,7 +591,7 @@ class HTMLLinter(HTMLParser):
             # Add in any errors from the preprocessor which weren't fatal
             errors.extend(self.preprocessor.errors)
 
-        errors.sort(key=lambda error: (error.line, error.column))
+        errors.sort(key=operator.attrgetter("line", "column"))
 
         return result, errors
 
@@ -409,7 +628,7 @@ class HTMLLinter(HTMLParser):
         if decl_lower != decl and not self.fix:
             self._log_error("F1")
 
-        decl_lower_joined = " ".join(decl_lower.split())
+        decl_lower_joined = collapse_whitespace(decl_lower)
         if self.fix:
             decl_lower = decl_lower_joined
         elif decl_lower != decl_lower_joined:
@@ -449,11 +668,12 @@ class HTMLLinter(HTMLParser):
         is_new_line = self._expected_indentation is not None
         self._reconcile_indentation()
 
-        if not self.fix and tag != tag.lower():
+        tag_lower = tag.lower()
+        if not self.fix and tag != tag_lower:
             # Tag isn't lowercase
             self._log_error("F7", tag=f"<{tag}>")
 
-        tag = tag.lower()
+        tag = tag_lower
 
         # Decide whether this should be kept on one line or should wrap
         num_long_attrs = 0
@@ -468,10 +688,14 @@ class HTMLLinter(HTMLParser):
                 num_xlong_attrs += 1
             if value_length >= self.xxlong_attr_value_length:
                 num_xxlong_attrs += 1
-            if attr[1] and any((char in attr[1] for char in ("\n", "\t"))):
+            if attr[1] and ("\n" in attr[1] or "\t" in attr[1]):
                 num_breaking_attrs += 1
 
-        _, attr_strings = self._make_attr_strings(attrs)
+        if attrs:
+            _, attr_strings = self._make_attr_strings(attrs)
+        else:
+            # Most tags have no attributes; There's nothing to prepare or sort
+            attr_strings = []
 
         wrap = any(
             (
@@ -492,9 +716,9 @@ class HTMLLinter(HTMLParser):
             # Wrap the attribute strings. Each attribute will get a new line,
             # and attributes with multi-line values will be indented to the
             # standard level based on the presence of newlines in their value.
-            indentation = self.indentation * (self._indentation_level + 1)
-            value_indentation = f"{indentation}{self.indentation}"
-            end_char = self.indentation * self._indentation_level
+            indentation = self._get_indentation(self._indentation_level + 1)
+            value_indentation = self._get_indentation(self._indentation_level + 2)
+            end_char = self._get_indentation(self._indentation_level)
 
             adjusted_attr_strings = []
             indentations = (" " * self.tab_width, "\t")
@@ -520,9 +744,9 @@ class HTMLLinter(HTMLParser):
                         for line in lines:
                             num_indents = 0
                             index = 0
-                            while any((line[index:].startswith(char) for char in indentations)):
+                            while line.startswith(indentations, index):
                                 num_indents += 1
-                                if line[index:].startswith(" "):
+                                if line.startswith(" ", index):
                                     index += self.tab_width
                                 else:
                                     index += 1
@@ -535,7 +759,7 @@ class HTMLLinter(HTMLParser):
 
                         indented_lines = []
                         for line_info in indentation_and_lines:
-                            line_indentation = self.indentation * (line_info[0] - min_indents)
+                            line_indentation = self._get_indentation(line_info[0] - min_indents)
                             indented_lines.append(f"{line_indentation}{line_info[1]}")
 
                         value = f"\n{value_indentation}".join(indented_lines)
@@ -544,8 +768,9 @@ class HTMLLinter(HTMLParser):
                         )
                 adjusted_attr_strings.append(adjusted_attr_string)
 
-            attrs_string = f"\n{indentation}".join(adjusted_attr_strings)
-            attrs_string = f"\n{indentation}{attrs_string}\n{end_char}"
+            line_break = f"\n{indentation}"
+            attrs_string = line_break.join(adjusted_attr_strings)
+            attrs_string = f"{line_break}{attrs_string}\n{end_char}"
         elif attr_strings:
             adjusted_attr_strings = []
 
@@ -553,7 +778,7 @@ class HTMLLinter(HTMLParser):
                 # Remove formatting-specific newlines & indentations
                 preserve_spaces = attr_string.startswith(" "), attr_string.endswith(" ")
 
-                adjusted_attr_string = re.sub(r"\s*\n\s*", " ", attr_string)
+                adjusted_attr_string = WRAPPED_WHITESPACE_REGEX.sub(" ", attr_string)
 
                 if not preserve_spaces[0]:
                     adjusted_attr_string = adjusted_attr_string.lstrip()
@@ -569,9 +794,15 @@ class HTMLLinter(HTMLParser):
             # No attributes
             attrs_string = ""
 
-        if not self.fix:
-            new_whitespace = list(filter(is_whitespace, list(attrs_string)))
-            old_whitespace = list(filter(is_whitespace, list(self.__starttag_text)))
+        # Tags which are already formatted have the same whitespace, too,
+        # unless the tag name itself contains whitespace
+        should_check_whitespace = not self.fix and (
+            self.__starttag_text != f"<{tag}{attrs_string}>"
+            or not NON_WHITESPACE_REGEX.fullmatch(tag)
+        )
+        if should_check_whitespace:
+            new_whitespace = NON_WHITESPACE_REGEX.sub("", attrs_string)
+            old_whitespace = NON_WHITESPACE_REGEX.sub("", self.__starttag_text)
 
             if new_whitespace != old_whitespace:
                 if "\n" in new_whitespace and "\n" not in old_whitespace and wrap:
@@ -586,6 +817,7 @@ class HTMLLinter(HTMLParser):
         if tag not in VOID_ELEMENTS:
             # Tag should be closed, add it to the stack.
             self._tag_stack.append((tag, self._indentation_level))
+            self._open_tag_counts[tag] += 1
 
             if tag != "html":
                 # All non-void elements increase the expected indentation level
@@ -597,19 +829,27 @@ class HTMLLinter(HTMLParser):
 
     def handle_endtag(self, tag):
         """Process a closing tag."""
-        if not self.fix and tag != tag.lower():
+        tag_lower = tag.lower()
+        if not self.fix and tag != tag_lower:
             self._log_error("F7", tag=f"</{tag}>")
 
-        tag = tag.lower()
+        tag = tag_lower
+
+        if self._open_tag_counts[tag]:
+            # Find the matching opening tag nearest the top of the stack
+            tag_stack = self._tag_stack
+            index = len(tag_stack) - 1
+            while tag_stack[index][0] != tag:
+                index -= 1
+
+            # Tags opened after it were never closed
+            for expected_tag, _ in reversed(tag_stack[index + 1 :]):
+                self._open_tag_counts[expected_tag] -= 1
+                self._log_error("D3", tag=f"</{expected_tag}>")
 
-        if tag in {tag_info[0] for tag_info in self._tag_stack}:
-            # Pop self._tag_stack until we find the matching opening tag
-            while self._tag_stack:
-                expected_tag = self._tag_stack.pop()
-                if expected_tag[0] == tag:
-                    self._indentation_level = expected_tag[1]
-                    break
-                self._log_error("D3", tag=f"</{expected_tag[0]}>")
+            self._open_tag_counts[tag] -= 1
+            self._indentation_level = tag_stack[index][1]
+            self._tag_stack = tag_stack[:index]
         else:
             self._log_error("D4", tag=f"</{tag}>")
 
@@ -629,103 +869,67 @@ class HTMLLinter(HTMLParser):
                 self._process(html_data)
             return
 
-        indentation = self.indentation * self._indentation_level
+        indentation = self._get_indentation(self._indentation_level)
 
-        # Check for & fix trailing whitespace
-        trailing_whitespace = r"[ \t]+\n"
         if self.fix:
-            html_data = re.sub(trailing_whitespace, "\n", html_data)
+            html_data = self._fix_data_whitespace(html_data, indentation)
 
-        else:
-            for match in re.finditer(trailing_whitespace, html_data):
-                start = match.start()
-                line_offset = html_data.count("\n", 0, start)
-                column = html_data.rfind("\n", 0, start) - 1
-                self._log_error("F2", line_offset=line_offset, column=column)
-
-        # Check for & fix inappropriate indentation
-        some_indentation = r"\n[ \t]*"
-        new_html_data = re.sub(some_indentation, f"\n{indentation}", html_data)
+            if html_data.endswith(f"\n{indentation}"):
+                if indentation:
+                    html_data = html_data[: -1 * len(indentation)]
 
-        if indentation:
-            blank_line = f"\n{indentation}\n"
+                # We should add indentation once we know how deep to indent.
+                self._expected_indentation = True
 
-            while blank_line in new_html_data:
-                new_html_data = new_html_data.replace(blank_line, "\n\n")
+            self._process(html_data)
+            return
 
-        if new_html_data.endswith(f"\n{indentation}"):
-            if indentation:
-                new_html_data = new_html_data[: -1 * len(indentation)]
+        if html_data and "\n" not in html_data:
+            # Without line breaks, there's no trailing whitespace, indentation
+            # or vertical whitespace to check.
+            self._check_horizontal_whitespace(html_data)
+            return
 
-            # We should add indentation once we know how deep to indent.
-            self._expected_indentation = True
+        # Check for trailing whitespace
+        if " \n" in html_data or "\t\n" in html_data:
+            line_offset = 0
+            cursor = 0
+            for match in TRAILING_WHITESPACE_REGEX.finditer(html_data):
+                start = match.start()
+                line_offset += html_data.count("\n", cursor, start)
+                cursor = start
+                column = html_data.rfind("\n", 0, start) - 1
+                self._log_error("F2", line_offset=line_offset, column=column)
 
-        if self.fix:
-            html_data = new_html_data
-        else:
-            html_lines = html_data.split("\n")
-            new_html_lines = new_html_data.split("\n")
-            for index, line in enumerate(new_html_lines):
-                if index == len(new_html_lines) - 1 and not line:
-                    # This is the last line; We don't know what's coming next
-                    if not self.fix:
-                        # We should confirm the indentation once we know it.
-                        self._expected_indentation = html_lines[index]
-                    break
-
-                # This isn't the last line
-                original_line = html_lines[index]
-                if line != original_line:
-                    self._log_error("F3", line_offset=index, column=0)
-
-        # Check for & fix too many consecutive empty lines
-        extra_vertical_lines = r"\n{3,}"
-        if self.fix:
-            html_data = re.sub(extra_vertical_lines, "\n\n", html_data)
-        else:
-            for match in re.finditer(extra_vertical_lines, html_data):
-                line_offset = html_data.count("\n", 0, match.start())
+        # Check for inappropriate indentation, comparing each line with how
+        # it would be fixed: Lines after a line break are indented to the
+        # current level, and lines without content are emptied.
+        html_lines = html_data.split("\n")
+        last_index = len(html_lines) - 1
+        for index, line in enumerate(html_lines):
+            new_line = line
+            if index:
+                line_contents = line.lstrip(" \t")
+                new_line = f"{indentation}{line_contents}" if line_contents else ""
+
+            if index == last_index and not new_line:
+                # This is the last line; We don't know what's coming next, so
+                # we should confirm the indentation once we know it.
+                self._expected_indentation = line
+            elif new_line != line:
+                self._log_error("F3", line_offset=index, column=0)
+
+        # Check for too many consecutive empty lines
+        if "\n\n\n" in html_data:
+            line_offset = 0
+            cursor = 0
+            for match in EXTRA_VERTICAL_LINES_REGEX.finditer(html_data):
+                start = match.start()
+                line_offset += html_data.count("\n", cursor, start)
+                cursor = start
                 self._log_error("F4", line_offset=line_offset, column=0)
 
-        lines = []
-        for index, line in enumerate(html_data.split("\n")):
-            line_contents = line
-            line_start = ""
-
-            # We don't assume that the lines have been indented, or have had
-            # trailing whitespace removed, since we might not be in "fix" mode
-            if index > 0:
-                line_contents = line_contents.lstrip()
-                line_start = line[: len(line) - len(line_contents)]
-
-            trimmed_line_contents = line_contents.lstrip()
-            leading_space = " " if 0 < len(trimmed_line_contents) < len(line_contents) else ""
-
-            trimmed_line_contents = line_contents.rstrip()
-            trailing_space = " " if len(trimmed_line_contents) < len(line_contents) else ""
-
-            new_line_contents = " ".join(line_contents.split())
-            new_line_contents = f"{leading_space}{new_line_contents}{trailing_space}"
-            if self.fix:
-                line = f"{line_start}{new_line_contents}"
-            elif line_contents.rstrip() != new_line_contents.rstrip():
-                # Find first character where the differ
-                len_line = min(len(line_contents.rstrip()), len(new_line_contents.rstrip()))
-                column = next(
-                    (
-                        column
-                        for column in range(len_line)
-                        if line_contents[column] != new_line_contents[column]
-                    ),
-                    len_line,
-                )
-
-                self._log_error("F5", line_offset=index, column=len(line_start) + column)
-
-            lines.append(line)
-
-        if self.fix:
-            self._process("\n".join(lines))
+        self._check_horizontal_whitespace(html_data)
 
     def handle_instruction(self, instruction_text):
         """Process a dynamic template instruction placeholder."""
@@ -736,12 +940,13 @@ class HTMLLinter(HTMLParser):
         elif instruction_type == InstructionType.END_FREEFORM:
             self._freeform_level -= 1
 
-        if instruction_type.decrease_indentation:
+        flags = instruction_type.flags
+        if flags & INSTRUCTION_DECREASES_INDENTATION:
             self._indentation_level -= 1
 
         self._reconcile_indentation()  # Between the indentation change
 
-        if instruction_type.increase_indentation:
+        if flags & INSTRUCTION_INCREASES_INDENTATION:
             self._indentation_level += 1
 
         if self.fix:
@@ -771,6 +976,26 @@ class HTMLLinter(HTMLParser):
         if self.fix:
             self._process(f"<!--{comment}-->")
 
+    def updatepos(self, cursor, cursor2):
+        """Move the position forward to cursor2, returning it."""
+        if cursor < cursor2:
+            self._cursor = cursor2
+        return cursor2
+
+    def getpos(self):
+        """Return the line & column of the current position in the raw data."""
+        offsets = self._line_break_offsets
+        if offsets is None:
+            # Index the line breaks the first time a position is needed
+            offsets = [match.start() for match in LINE_BREAK_REGEX.finditer(self.rawdata)]
+            self._line_break_offsets = offsets
+
+        cursor = self._cursor
+        num_lines = bisect_left(offsets, cursor)
+        if num_lines:
+            return num_lines + 1, cursor - offsets[num_lines - 1] - 1
+        return 1, cursor
+
     def goahead(self, end):
         """Handle data as far as reasonably possible.
 
@@ -780,64 +1005,59 @@ class HTMLLinter(HTMLParser):
         This modified version doesn't support multiple calls to "feed" or
         convert_charrefs mode.
         """
-        interesting_regex = r"&|<"
-        if self.preprocessor:
-            wraps = self.preprocessor.delimiters
-            opening_regex_part = re.escape(wraps[0])
-            interesting_regex = f"{interesting_regex}|(?:{opening_regex_part})"
+        rawdata = self.rawdata
+        startswith = rawdata.startswith
 
-        interesting = re.compile(interesting_regex)
-        entityref = re.compile("&([a-zA-Z][-.a-zA-Z0-9]*);")
-        charref = re.compile("&#(?:[0-9]+|[xX][0-9a-fA-F]+);")
-        starttagopen = re.compile("<[a-zA-Z]")
-        endtagopen = re.compile("</[a-zA-Z]")
+        # Loop invariants
+        handle_data = self.handle_data
+        updatepos = self.updatepos
+        prefix, postfix = self.preprocessor.delimiters if self.preprocessor else (None, None)
+        interesting = get_interesting_regex(prefix)
+        fix = self.fix
+        bare_ampersand = "&amp;" if fix else "&"
 
-        rawdata = self.rawdata
         cursor = 0
         size = len(rawdata)
         while cursor < size:
-            match = interesting.search(rawdata, cursor)  # < or &, or a dynamic tag
-            if match:
-                cursor2 = match.start()
+            if self._freeform_level:
+                # We're in a freeform tag; Everything other than the dynamic
+                # tags should just be reproduced as-is
+                cursor2 = rawdata.find(prefix, cursor)
             else:
+                match = interesting.search(rawdata, cursor)  # < or &, or a dynamic tag
+                cursor2 = match.start() if match else -1
+            if cursor2 < 0:
                 cursor2 = size
             if cursor < cursor2:
-                self.handle_data(rawdata[cursor:cursor2])
-            cursor = self.updatepos(cursor, cursor2)
+                handle_data(rawdata[cursor:cursor2])
+            cursor = updatepos(cursor, cursor2)
             if cursor == size:
                 break
 
-            startswith = rawdata.startswith
-
-            if self.preprocessor:
-                # Check for the opening of a dynamic tag
-                prefix, postfix = self.preprocessor.delimiters
-                if startswith(prefix, cursor):
-                    cursor2 = rawdata.find(postfix, cursor + 1)  # Should always be >= 0
-                    instruction_text = rawdata[cursor + 1 : cursor2]
-                    self.handle_instruction(instruction_text)
-                    cursor = self.updatepos(cursor, cursor2 + 1)
-                    continue
+            char = rawdata[cursor]
 
-            if self._freeform_level:
-                # We're in a freeform tag; Everything other than the dynamic
-                # tags should just be reproduced as-is
-                self.handle_data(rawdata[cursor : cursor + 1])
-                cursor = self.updatepos(cursor, cursor + 1)
+            # Check for the opening of a dynamic tag
+            if char == prefix:
+                cursor2 = rawdata.find(postfix, cursor + 1)  # Should always be >= 0
+                instruction_text = rawdata[cursor + 1 : cursor2]
+                self.handle_instruction(instruction_text)
+                cursor = updatepos(cursor, cursor2 + 1)
                 continue
 
-            if startswith("<", cursor):
-                if starttagopen.match(rawdata, cursor):  # < + letter
+            if char == "<":
+                match = TAG_OPEN_REGEX.match(rawdata, cursor)
+                tag_open_kind = match.lastgroup if match else None
+                if tag_open_kind == "start":  # < + letter
                     cursor2 = self.parse_starttag(cursor)
-                elif endtagopen.match(rawdata, cursor):
+                elif tag_open_kind == "end":
                     cursor2 = self.parse_endtag(cursor)
-                elif startswith("<!--", cursor):
+                elif tag_open_kind == "comment":
                     cursor2 = self.parse_comment(cursor)
-                elif startswith("<!", cursor):
+                elif tag_open_kind == "declaration":
                     cursor2 = self.parse_html_declaration(cursor)
                 else:
                     self._log_error("E3")
-                    self.handle_data("<")
+                    handle_data("<")
                     cursor2 = cursor + 1
 
                 if cursor2 < 0:
@@ -848,56 +1068,45 @@ class HTMLLinter(HTMLParser):
                             cursor2 = cursor + 1
                     else:
                         cursor2 += 1
-                    self.handle_data(rawdata[cursor:cursor2])
-                cursor = self.updatepos(cursor, cursor2)
+                    handle_data(rawdata[cursor:cursor2])
+                cursor = updatepos(cursor, cursor2)
                 continue
 
-            if startswith("&#", cursor):
-                match = charref.match(rawdata, cursor)
-                if match:
-                    name = match.group()[2:-1]
-                    cursor2 = match.end()
-                    self.handle_charref(name)
-                    cursor = self.updatepos(cursor, cursor2)
-                    continue
+            # Otherwise, this is an "&"
+            match = CHARACTER_REFERENCE_REGEX.match(rawdata, cursor)
+            if match:
+                if match.lastgroup == "charref":
+                    self.handle_charref(match.group("charref"))
+                else:
+                    self.handle_entityref(match.group("entityref"))
+                cursor = updatepos(cursor, match.end())
+                continue
 
+            if startswith("&#", cursor):
                 # bail by consuming &#
                 if self.cdata_elem is not None:
                     self._log_error("E2")
 
-                self.handle_data(rawdata[cursor : cursor + 2])
-                cursor = self.updatepos(cursor, cursor + 2)
+                handle_data(rawdata[cursor : cursor + 2])
+                cursor = updatepos(cursor, cursor + 2)
                 continue
 
-            if startswith("&", cursor):
-                match = entityref.match(rawdata, cursor)
-                if match:
-                    name = match.group(1)
-                    cursor2 = match.end()
-                    self.handle_entityref(name)
-                    cursor = self.updatepos(cursor, cursor2)
-                    continue
+            if self.cdata_elem is not None:
+                handle_data("&")
+                cursor = updatepos(cursor, cursor + 1)
+                continue
 
-                if self.cdata_elem is not None:
-                    self.handle_data("&")
-                    cursor = self.updatepos(cursor, cursor + 1)
-                    continue
-
-                # can't be confused with some other construct
-                ref_data = "&amp;"
-                if self.fix:
-                    ref_data = "&amp;"
-                else:
-                    ref_data = "&"
-                    self._log_error("E2")
+            # can't be confused with some other construct
+            if not fix:
+                self._log_error("E2")
 
-                self.handle_data(ref_data)
-                cursor = self.updatepos(cursor, cursor + 1)
+            handle_data(bare_ampersand)
+            cursor = updatepos(cursor, cursor + 1)
 
         # end while
         if cursor < size:
-            self.handle_data(rawdata[cursor:size])
-            cursor = self.updatepos(cursor, size)
+            handle_data(rawdata[cursor:size])
+            cursor = updatepos(cursor, size)
         self.rawdata = rawdata[cursor:]
 
     def parse_starttag(self, cursor):
@@ -906,21 +1115,11 @@ class HTMLLinter(HTMLParser):
         Adapted from:
         https://github.com/python/cpython/blob/3.10/Lib/html/parser.py
         """
-        attrfind_tolerant = re.compile(
-            r'((?<=[\'"\s/])[^\s/>][^\s/=>]*)(\s*=+\s*'
-            + r'(\'[^\']*\'|"[^"]*"|(?![\'"])[^>\s]*))?(?:\s|/(?!>))*',
-        )
-
-        tagfind_tolerant = re.compile(r"([a-zA-Z][^\t\n\r\f />\x00]*)(?:\s|/(?!>))*")
         rawdata = self.rawdata
 
         self.__starttag_text = None  # noqa: WPS112 (copied)
         if self.preprocessor:
-            wraps = self.preprocessor.delimiters
-            wrap_regex = re.escape(wraps[0])
-            overlap = re.compile(
-                rf"<([a-zA-Z][-.a-zA-Z0-9:_]*){wrap_regex}",
-            )
+            overlap, _ = get_overlap_regexes(self.preprocessor.delimiters[0])
             match = overlap.match(rawdata, cursor)
             if match:
                 line, column = self.getpos()
@@ -936,25 +1135,28 @@ class HTMLLinter(HTMLParser):
             self._log_error("D7")
             return end_cursor
 
-        self.__starttag_text = rawdata[cursor:end_cursor]  # noqa: WPS112 (copied)
+        if not self.fix:
+            # Only needed for comparing the whitespace in the original tag
+            self.__starttag_text = rawdata[cursor:end_cursor]  # noqa: WPS112 (copied)
 
         attrs = []
-        match = tagfind_tolerant.match(rawdata, cursor + 1)
+        match = TAGFIND_TOLERANT_REGEX.match(rawdata, cursor + 1)
         cursor2 = match.end()
 
         tag = match.group(1)
         self.lasttag = tag.lower()
         while cursor2 < end_cursor:
-            match = attrfind_tolerant.match(rawdata, cursor2)
+            match = ATTRFIND_TOLERANT_REGEX.match(rawdata, cursor2)
             if not match:
                 break
 
             attrname, rest, attrvalue = match.group(1, 2, 3)
+            # Values which start with a quote always end with the same quote
             if not rest:
                 attrvalue = None
-            elif attrvalue[:1] == '"' == attrvalue[-1:]:
+            elif attrvalue.startswith('"'):
                 attrvalue = attrvalue[1:-1]
-            elif attrvalue[:1] == "'" == attrvalue[-1:]:
+            elif attrvalue.startswith("'"):
                 attrvalue = attrvalue[1:-1]
                 if '"' not in attrvalue:
                     self._log_error("F10", attr=attrname)
@@ -966,12 +1168,6 @@ class HTMLLinter(HTMLParser):
 
         end = rawdata[cursor2:end_cursor].strip()
         if end not in {">", "/>"}:
-            lineno, offset = self.getpos()
-            if "\n" in self.__starttag_text:
-                lineno = lineno + self.__starttag_text.count("\n")
-                offset = len(self.__starttag_text) - self.__starttag_text.rfind("\n")
-            else:
-                offset = offset + len(self.__starttag_text)
             self.handle_data(rawdata[cursor:end_cursor])
 
             return end_cursor
@@ -981,9 +1177,8 @@ class HTMLLinter(HTMLParser):
             self.handle_startendtag(tag, attrs)
         else:
             self.handle_starttag(tag, attrs)
-            tag = tag.lower()
-            if tag in self.CDATA_CONTENT_ELEMENTS:
-                self.set_cdata_mode(tag)
+            if self.lasttag in self.CDATA_CONTENT_ELEMENTS:
+                self.set_cdata_mode(self.lasttag)
 
         return end_cursor
 
@@ -995,15 +1190,10 @@ class HTMLLinter(HTMLParser):
         """
         rawdata = self.rawdata
 
-        endtagfind = re.compile(r"</([a-zA-Z][-.a-zA-Z0-9:_]*)\s*>")
-        match = endtagfind.match(rawdata, cursor)  # </ + tag + >
+        match = ENDTAGFIND_REGEX.match(rawdata, cursor)  # </ + tag + >
         if not match:
             if self.preprocessor:
-                wraps = self.preprocessor.delimiters
-                wrap_regex = re.escape(wraps[0])
-                overlap = re.compile(
-                    rf"</[a-zA-Z][-.a-zA-Z0-9:_]*\s*{wrap_regex}",
-                )
+                _, overlap = get_overlap_regexes(self.preprocessor.delimiters[0])
                 match = overlap.match(rawdata, cursor)
                 if match:
                     line, column = self.getpos()
@@ -1021,9 +1211,10 @@ class HTMLLinter(HTMLParser):
         tag = match.group(1)
 
         parsed_data = rawdata[cursor:end_cursor]
-        if any((char in string.whitespace for char in rawdata[cursor:end_cursor])):
+        if parsed_data.translate(WHITESPACE_DELETION_TABLE) != parsed_data:
             if self.fix:
-                parsed_data = re.sub(r"\s", "", parsed_data)
+                # Only the space before ">" can hold whitespace
+                parsed_data = f"</{tag}>"
             else:
                 self._log_error("F11", tag=f"</{tag}>")
 
@@ -1038,15 +1229,27 @@ class HTMLLinter(HTMLParser):
         return end_cursor
 
     def _process(self, html_chunk):
-        self._result.append(html_chunk)
+        self._result.write(html_chunk)
 
-        len_chunk = len(html_chunk)
-        num_lines = html_chunk.count("\n")
-        self._line += num_lines
-        if num_lines:
-            self._column = len_chunk - html_chunk.rfind("\n") - 1
+        # Most chunks are tags without line breaks, which only need the one
+        # scan to find that out
+        last_line_break = html_chunk.rfind("\n")
+        if last_line_break < 0:
+            self._column += len(html_chunk)
         else:
-            self._column += len_chunk
+            self._line += html_chunk.count("\n", 0, last_line_break + 1)
+            self._column = len(html_chunk) - last_line_break - 1
+
+    def _get_indentation(self, level):
+        """Return a string to indent a line to the given level."""
+        if level <= 0:
+            return ""
+
+        indentations = self._indentations
+        while len(indentations) <= level:
+            indentations.append(f"{indentations[-1]}{self.indentation}")
+
+        return indentations[level]
 
     def _did_encounter_data(self):
         self._mode = self._mode or Mode.UNSTRUCTURED
@@ -1055,7 +1258,7 @@ class HTMLLinter(HTMLParser):
         if self._expected_indentation is None:
             return
 
-        indentation = self.indentation * (self._indentation_level + adjustment)
+        indentation = self._get_indentation(self._indentation_level + adjustment)
         if self.fix:
             self._process(indentation)
         elif self._expected_indentation != indentation:
@@ -1063,6 +1266,43 @@ class HTMLLinter(HTMLParser):
 
         self._expected_indentation = None
 
+    def _check_horizontal_whitespace(self, html_data):
+        """Log errors for extra horizontal whitespace in some HTML data.
+
+        Only lines with a run of whitespace other than a single space before
+        some content can differ once collapsed.
+        """
+        index = 0
+        cursor = 0
+        last_index = None
+        for match in EXTRA_HORIZONTAL_WHITESPACE_REGEX.finditer(html_data):
+            start = match.start()
+            index += html_data.count("\n", cursor, start)
+            cursor = start
+            if index == last_index:
+                # Only the first difference on each line is reported
+                continue
+            last_index = index
+
+            # The whitespace before this run on the line is already collapsed,
+            # so the first difference is at the run itself, or at its second
+            # character if it starts with a space.
+            column = start - html_data.rfind("\n", 0, start) - 1
+            if match.group().startswith(" "):
+                column += 1
+
+            self._log_error("F5", line_offset=index, column=column)
+
+    def _fix_data_whitespace(self, html_data, indentation):
+        """Normalize the whitespace in some HTML data in a single pass.
+
+        Removes trailing whitespace, indents each line, limits consecutive
+        empty lines to one, and collapses other whitespace to single spaces.
+        Whitespace at the start of a line which isn't a space or tab is kept.
+        """
+        replace = partial(_replace_data_whitespace, html_data, indentation)
+        return DATA_WHITESPACE_REGEX.sub(replace, html_data)
+
     def _make_attr_strings(self, attrs):
         """Return the prepared attribute strings.
 
@@ -1072,15 +1312,21 @@ class HTMLLinter(HTMLParser):
         The first return value is a key for sorting the whole set in a higher-
         level set. The second is a list of attribute strings.
         """
+        if self.preprocessor:
+            start_delimiter, end_delimiter = self.preprocessor.delimiters
+        else:
+            start_delimiter, end_delimiter = None, None
+
+        indentation = self._get_indentation(1)
+
         all_attrs = []
         for attr in attrs:
             name, value = attr
 
-            if self.preprocessor:
-                wraps = self.preprocessor.delimiters
-                while wraps[0] in name:
-                    start_index = name.index(wraps[0])
-                    end_index = name.index(wraps[1]) + 1
+            if start_delimiter:
+                start_index = name.find(start_delimiter)
+                while start_index >= 0:
+                    end_index = name.index(end_delimiter, start_index) + 1
 
                     if start_index > 0:
                         split_name = name[:start_index]
@@ -1097,6 +1343,7 @@ class HTMLLinter(HTMLParser):
                     all_attrs.append((split_name, None, quote_char))
 
                     name = name[end_index:]
+                    start_index = name.find(start_delimiter)
             if name:
                 name_lower = name.lower()
                 if not self.fix and name != name_lower:
@@ -1107,19 +1354,17 @@ class HTMLLinter(HTMLParser):
 
         attr_groups_by_key = []
 
-        index = 0
         group_level = 0
 
         group = []
-        while index < len(all_attrs):
-            name, value, quote_char = all_attrs[index]
+        for name, value, quote_char in all_attrs:
             attr = name, value
 
-            instruction_type = None
-            if self.preprocessor and name.startswith(self.preprocessor.delimiters[0]):
-                instruction_type = InstructionType(name[1])
+            flags = 0
+            if start_delimiter and name.startswith(start_delimiter):
+                flags = INSTRUCTION_TYPE_FLAGS.get(name[1], 0)
 
-            if instruction_type and instruction_type.is_group_start:
+            if flags & INSTRUCTION_GROUP_START:
                 group_level += 1
                 if group_level == 1:
                     group.append(name)
@@ -1127,20 +1372,20 @@ class HTMLLinter(HTMLParser):
                     subgroup_attrs = []
                 else:
                     subgroup_attrs.append(attr)
-            elif instruction_type and instruction_type.is_group_middle:
+            elif flags & INSTRUCTION_GROUP_MIDDLE:
                 if group_level == 1:
                     subgroup_key, subgroup = self._make_attr_strings(subgroup_attrs)
                     group_key = min((group_key, subgroup_key)) if group_key else subgroup_key
-                    group += [f"{self.indentation}{attr_string}" for attr_string in subgroup]
+                    group += [f"{indentation}{attr_string}" for attr_string in subgroup]
                     group.append(name)
                     subgroup_attrs = []
                 else:
                     subgroup_attrs.append(attr)
-            elif instruction_type and instruction_type.is_group_end:
+            elif flags & INSTRUCTION_GROUP_END:
                 if group_level == 1:
                     subgroup_key, subgroup = self._make_attr_strings(subgroup_attrs)
                     group_key = min((group_key, subgroup_key)) if group_key else subgroup_key
-                    group += [f"{self.indentation}{attr_string}" for attr_string in subgroup]
+                    group += [f"{indentation}{attr_string}" for attr_string in subgroup]
                     group.append(name)
                     attr_groups_by_key.append((group_key, group))
                 else:
@@ -1154,13 +1399,12 @@ class HTMLLinter(HTMLParser):
                     attr_string = f"{attr_string}={quote_char}{value}{quote_char}"
                 attr_groups_by_key.append((name, [attr_string]))
 
-            index += 1
-
         if self.fix:
             attr_groups_by_key.sort(key=self.attr_sort)
         else:
-            sorted_groups = sorted(attr_groups_by_key, key=self.attr_sort)
-            if attr_groups_by_key != sorted_groups:
+            # The groups are out of order if any key is greater than the next
+            sort_keys = [self.attr_sort(attr_group) for attr_group in attr_groups_by_key]
+            if any(map(operator.gt, sort_keys, sort_keys[1:])):
                 self._log_error("F6")
 
         try:
@@ -1168,14 +1412,15 @@ class HTMLLinter(HTMLParser):
         except IndexError:
             sort_key = None
 
+        indentation_length = len(indentation)
         attr_strings = []
         for _, group in attr_groups_by_key:
             if (  # noqa: WPS337 (Dynamic loop condition)
                 len(group) == 3
                 and "\n" not in group[1]
-                and len(group[1][len(self.indentation)]) <= self.long_attr_value_length
+                and len(group[1][indentation_length]) <= self.long_attr_value_length
             ):
-                group[1] = group[1][len(self.indentation) :]  # Strip leading indentation
+                group[1] = group[1][indentation_length:]  # Strip leading indentation
                 attr_strings.append("".join(group))
             elif len(group) == 2:
                 attr_strings.append("".join(group))
@@ -1190,15 +1435,6 @@ class HTMLLinter(HTMLParser):
         if column is None:
             column = current_column
 
-        replacements = {}
-        for keyword, value in kwargs.items():
-            replacements[keyword] = value
+        replacements = kwargs
 
-        self._errors.append(
-            Error(
-                line=line,
-                column=column,
-                rule=Rule.get(rule_code),
-                replacements=replacements,
-            ),
-        )
+        self._errors.append((line, column, rule_code, replacements))
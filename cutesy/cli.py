@@ -1,6 +1,9 @@
 """Expose Cutesy via CLI."""
 
 # Standard Library
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
 # Third Party
@@ -10,6 +13,43 @@ import click
 from . import DoctypeError, HTMLLinter, PreprocessingError
 from .preprocessors import django
 
+# Characters of HTML to lint per worker process. Starting each worker takes
+# about as long as linting 10,000 characters, so with less than this much work
+# per worker, the workers cost more time than they save.
+MIN_CHARS_PER_LINT_PROCESS = 25000
+
+
+def lint_html(linter, html):
+    """Lint some HTML.
+
+    Returns the result, the errors, whether preprocessing failed, and whether
+    the HTML was skipped due to its doctype.
+    """
+    try:
+        result, errors = linter.lint(html)
+    except DoctypeError:
+        return None, [], False, True
+    except PreprocessingError as preprocessing_error:
+        return None, preprocessing_error.errors, True, False
+
+    return result, errors, False, False
+
+
+def lint_all_html(linter, htmls):
+    """Lint each HTML string, in parallel when there's enough work."""
+    num_chars = sum(len(html) for html in htmls)
+    num_workers = min(
+        os.cpu_count() or 1,
+        len(htmls),
+        num_chars // MIN_CHARS_PER_LINT_PROCESS,
+    )
+    if num_workers <= 1:
+        return [lint_html(linter, html) for html in htmls]
+
+    chunksize = max(1, len(htmls) // (num_workers * 4))
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        return list(executor.map(partial(lint_html, linter), htmls, chunksize=chunksize))
+
 
 @click.command()
 @click.option(
@@ -67,21 +107,21 @@ def main(code, fix, return_zero, quiet, check_doctype, preprocessor, pattern):
                 html = html_file.read()
                 html_paths_and_strings.append((path, html))
 
-    result = None  # For passed-in-code mode
-    for path, html in html_paths_and_strings:
-        is_preprocessing_error = False  # These are "fatal"
+    lint_results = lint_all_html(linter, [html for _, html in html_paths_and_strings])
 
-        try:
-            result, errors = linter.lint(html)
-        except DoctypeError:
+    result = None  # For passed-in-code mode
+    for (path, html), lint_result in zip(html_paths_and_strings, lint_results):
+        file_result, errors, is_preprocessing_error, is_skipped = lint_result
+        if is_skipped:
             # Ignore this file due to non-HTML5 doctype, when this feature has
             # been enabled
             continue
-        except PreprocessingError as preprocessing_error:
-            is_preprocessing_error = True
+
+        # Preprocessing errors are "fatal"
+        if is_preprocessing_error:
             num_files_failed += 1
-            errors = preprocessing_error.errors
         else:
+            result = file_result
             if fix and html != result and path is not None:
                 with open(path, mode="w") as html_file:
                     html_file.write(result)
@@ -4,12 +4,14 @@
 import re
 import unicodedata
 from abc import ABC
+from functools import lru_cache, partial
+from types import MappingProxyType
 
 # Cutesy
 from utilities.base36 import base36_encode
 
 # Current App
-from .. import Error, InstructionType, PreprocessingError, Rule
+from .. import Error, InstructionType, PreprocessingError, get_rule
 
 SPECIAL_CHARS = frozenset(
     (
@@ -54,6 +56,64 @@ CLEAN_CHARS_AFTER_CLOSING = frozenset(
     ),
 )
 
+# A part of an instruction, between spaces; Spaces inside of quoted strings
+# don't count, and quotes preceded by a backslash don't end a string. A string
+# without an end runs to the end of the instruction.
+INSTRUCTION_PART_REGEX = re.compile(
+    r'(?:[^ \'"]|\'[\s\S]*?(?<!\\)\'|"[\s\S]*?(?<!\\)"|[\'"][\s\S]*)+',
+)
+
+# The instruction which ends each block instruction
+END_INSTRUCTIONS = MappingProxyType(
+    {
+        "block": "endblock",
+        "if": "endif",
+        "for": "endfor",
+        "while": "endwhile",
+        "with": "endwith",
+        "blocktrans": "endblocktrans",
+        "freeform": "endfreeform",
+        "spaceless": "endspaceless",
+        "spaceless_json": "endspaceless_json",
+    },
+)
+
+# The instruction type which opens each middle or end instruction type
+OPENING_INSTRUCTION_TYPES = MappingProxyType(
+    {
+        InstructionType.MID_CONDITIONAL: InstructionType.CONDITIONAL,
+        InstructionType.LAST_CONDITIONAL: InstructionType.CONDITIONAL,
+        InstructionType.END_PARTIAL: InstructionType.PARTIAL,
+        InstructionType.END_CONDITIONAL: InstructionType.CONDITIONAL,
+        InstructionType.END_REPEATABLE: InstructionType.REPEATABLE,
+        InstructionType.END_FREEFORM: InstructionType.FREEFORM,
+    },
+)
+
+
+@lru_cache(maxsize=None)
+def get_opening_braces_regex(braces):
+    """Return a pattern matching any of the given opening braces."""
+    opening_braces = (re.escape(brace_pair[0]) for brace_pair in braces)
+    return re.compile("|".join((f"(?:{brace})" for brace in opening_braces)))
+
+
+@lru_cache(maxsize=None)
+def get_closing_tag_regex(braces, closing_tag_string):
+    """Return a pattern matching a closing tag, allowing some padding."""
+    return re.compile(
+        rf"{re.escape(braces[0])}[ \t]*"
+        + rf"{re.escape(closing_tag_string)}[ \t]*"
+        + f"{re.escape(braces[1])}",
+    )
+
+
+@lru_cache(maxsize=None)
+def get_placeholder_regex(delimiters):
+    """Return a pattern matching the placeholders between some delimiters."""
+    start, end = (re.escape(delimiter) for delimiter in delimiters)
+    return re.compile(f"{start}[a-z][0-9a-z]*-*{end}")
+
 
 class SetupError(Exception):
     """An error that can be thrown when the preprocessor isn’t ready."""
@@ -77,28 +137,18 @@ class BasePreprocessor(ABC):
         self._fix = fix
 
         # Choose start and end delimiters for placeholders which do not appear
-        # in the HTML string
-        unused_char_num = 161
-        while all(  # noqa: WPS352 (dynamic condition body)
-            (
-                chr(unused_char_num) in dynamic_html,
-                chr(unused_char_num) not in SPECIAL_CHARS,
-                not unicodedata.combining(chr(unused_char_num)),
-            ),
-        ):
-            unused_char_num += 1
-
-        unused_char_2_num = unused_char_num + 1
-        while all(  # noqa: WPS352 (dynamic condition body)
-            (
-                chr(unused_char_2_num) in dynamic_html,
-                chr(unused_char_2_num) not in SPECIAL_CHARS,
-                not unicodedata.combining(chr(unused_char_2_num)),
-            ),
-        ):
-            unused_char_2_num += 1
-
-        self.delimiters = chr(unused_char_num), chr(unused_char_2_num)
+        # in the HTML string, and which aren't special or combining characters
+        used_chars = set(dynamic_html)
+        delimiters = []
+        char_num = 161
+        while len(delimiters) < 2:
+            char = chr(char_num)
+            char_num += 1
+            if char in used_chars or char in SPECIAL_CHARS or unicodedata.combining(char):
+                continue
+            delimiters.append(char)
+
+        self.delimiters = tuple(delimiters)
 
     def process(self):
         """Replace the dynamic parts of some dynamic HTML with placeholders."""
@@ -112,9 +162,10 @@ class BasePreprocessor(ABC):
         # Modified HTML parts, including placeholders for instructions
         self._modified_html_parts = []
 
-        opening_braces = (re.escape(braces[0]) for braces in self.braces)
-        pattern = "|".join((f"(?:{brace})" for brace in opening_braces))
-        interesting = re.compile(pattern)
+        # The lowercase dynamic HTML, made the first time it's needed
+        self._dynamic_html_lower = None
+
+        interesting = get_opening_braces_regex(tuple(self.braces))
 
         # Each placeholder includes an ID
         self._placeholder_id_num = 0
@@ -125,12 +176,19 @@ class BasePreprocessor(ABC):
         # Keep track of which instructions haven't been closed
         self._block_instruction_stack = []
 
+        # Sweep through the opening braces in one pass
+        matches = interesting.finditer(html)
+
         self._cursor = 0
         while self._cursor < size:
             cursor = self._cursor
 
-            # Search for an opening brace
-            match = interesting.search(html, cursor)
+            # Take the next opening brace; If the last instruction consumed it,
+            # search again from the cursor
+            match = next(matches, None)
+            if match and match.start() < cursor:
+                matches = interesting.finditer(html, cursor)
+                match = next(matches, None)
             cursor2 = match.start() if match else size
 
             if cursor < cursor2:
@@ -158,17 +216,7 @@ class BasePreprocessor(ABC):
         if self._block_instruction_stack:
             # Handle dangling open instructions
             _, last_instruction, braces = self._block_instruction_stack.pop()
-            expected_instruction = {
-                "block": "endblock",
-                "if": "endif",
-                "for": "endfor",
-                "while": "endwhile",
-                "with": "endwith",
-                "blocktrans": "endblocktrans",
-                "freeform": "endfreeform",
-                "spaceless": "endspaceless",
-                "spaceless_json": "endspaceless_json",
-            }[last_instruction]
+            expected_instruction = END_INSTRUCTIONS[last_instruction]
             tag_string = f"{braces[0]} {expected_instruction} {braces[1]}"
             raise self.make_fatal_error("P2", tag=tag_string)
 
@@ -183,34 +231,37 @@ class BasePreprocessor(ABC):
         # placeholders. Keep track of which instructions contained newlines and
         # where they were found, since the errors were not aware of those
         # newlines when they were generated.
+        # Each placeholder is as long as its instruction, so the locations are
+        # the same before & after restoring. Only the first occurrence of each
+        # placeholder is restored.
+        instructions = dict(self._instructions)
         inserted_newline_locations = []
-        for replacement, instruction in self._instructions:
-            if "\n" in instruction:
-                instruction_index = modified_html.find(replacement)
-                for newline_match in re.finditer(r"\n", instruction):
-                    inserted_newline_locations.append(instruction_index + newline_match.start())
 
-            modified_html = modified_html.replace(replacement, instruction, 1)
+        restore_instruction = partial(
+            self._restore_instruction,
+            instructions,
+            inserted_newline_locations,
+        )
+        placeholder_regex = get_placeholder_regex(self.delimiters)
+        modified_html = placeholder_regex.sub(restore_instruction, modified_html)
 
         # Adjust the line & column numbers according to the newlines found in
-        # the now-restored instructions
+        # the now-restored instructions. The locations are in ascending order,
+        # so the lines before each one can be counted incrementally.
         cursor = 0
         line = 0
-        column = 0
-        size = len(modified_html)
-        while cursor < size:
-            if modified_html[cursor] == "\n":
-                if cursor in inserted_newline_locations:
-                    for error in errors:
-                        if error.line > line:
-                            error.line += 1
-                        elif error.line == line and error.column >= column:
-                            error.line += 1
-                            error.column -= column
-                line += 1
-                column = 0
-            cursor += 1
-            column += 1
+        for location in inserted_newline_locations:
+            line += modified_html.count("\n", cursor, location)
+            cursor = location
+
+            line_start = modified_html.rfind("\n", 0, location)
+            column = location - line_start if line_start >= 0 else location
+            for error in errors:
+                if error.line > line:
+                    error.line += 1
+                elif error.line == line and error.column >= column:
+                    error.line += 1
+                    error.column -= column
 
         return modified_html
 
@@ -222,14 +273,12 @@ class BasePreprocessor(ABC):
             column = self.offset
 
         # Process any kwargs as string interpolations into the rule message.
-        replacements = {}
-        for keyword, value in kwargs.items():
-            replacements[keyword] = value
+        replacements = kwargs
 
         error = Error(
             line=line,
             column=column,
-            rule=Rule.get(rule_code),
+            rule=get_rule(rule_code),
             replacements=replacements,
         )
 
@@ -249,7 +298,6 @@ class BasePreprocessor(ABC):
         wraps = self.delimiters
         cursor = self._cursor
         html = self._dynamic_html
-        dynamic_html_lower = html.lower()
 
         len_start = len(braces[0])
         len_end = len(braces[1])
@@ -285,13 +333,12 @@ class BasePreprocessor(ABC):
             search_string = f"{braces[0]} {closing_tag_string} {braces[1]}"
             tag_string = f"{tag_string} … {search_string}"
 
-            search_regex = re.compile(
-                rf"{re.escape(braces[0])}[ \t]*"
-                + rf"{re.escape(closing_tag_string)}[ \t]*"
-                + f"{re.escape(braces[1])}",
-            )
+            search_regex = get_closing_tag_regex(braces, closing_tag_string)
+
+            if self._dynamic_html_lower is None:
+                self._dynamic_html_lower = html.lower()
 
-            match = search_regex.search(dynamic_html_lower, end_cursor)
+            match = search_regex.search(self._dynamic_html_lower, end_cursor)
             if not match:
                 raise self.make_fatal_error("P2", tag=search_string)
 
@@ -307,12 +354,7 @@ class BasePreprocessor(ABC):
                 raise hanging_closing_tag_error
             last_instruction_type = self._block_instruction_stack[-1][0]
 
-            expected_openings = {
-                InstructionType.MID_CONDITIONAL: InstructionType.CONDITIONAL,
-                InstructionType.LAST_CONDITIONAL: InstructionType.CONDITIONAL,
-            }
-
-            if last_instruction_type != expected_openings[instruction_type]:
+            if last_instruction_type != OPENING_INSTRUCTION_TYPES[instruction_type]:
                 raise hanging_closing_tag_error
 
         # End block-type instructions
@@ -324,14 +366,7 @@ class BasePreprocessor(ABC):
 
             last_instruction_type = last_instruction_info[0]
 
-            expected_openings = {
-                InstructionType.END_PARTIAL: InstructionType.PARTIAL,
-                InstructionType.END_CONDITIONAL: InstructionType.CONDITIONAL,
-                InstructionType.END_REPEATABLE: InstructionType.REPEATABLE,
-                InstructionType.END_FREEFORM: InstructionType.FREEFORM,
-            }
-
-            if last_instruction_type != expected_openings[instruction_type]:
+            if last_instruction_type != OPENING_INSTRUCTION_TYPES[instruction_type]:
                 raise hanging_closing_tag_error
 
         # Handle ignored instructions
@@ -365,49 +400,14 @@ class BasePreprocessor(ABC):
         middle_part = part[len_start : -1 * len_end]
 
         if collapse:
-            # Collapse the instruction, except the part inside of strings.
-            current_string_char = None
-            part_cursor = 0
-            part_size = len(middle_part)
-
-            middle_parts = []
-            current_part = ""
-            is_escape = False
-            while part_cursor < part_size:
-                was_escape = is_escape
-                is_escape = False
-
-                char = middle_part[part_cursor]
-                if char == " " and not current_string_char:
-                    middle_parts.append(current_part)
-                    current_part = ""
-                    part_cursor += 1
-                    continue
-
-                if current_string_char and char == "\\":
-                    is_escape = True
-                    current_part = f"{current_part}{char}"
-                    part_cursor += 1
-                    continue
-
-                for test_char in ("'", '"'):
-                    if char != test_char:
-                        continue
-
-                    if not current_string_char:
-                        current_string_char = char
-                        break
-
-                    if not was_escape and char == current_string_char:
-                        current_string_char = None
-
-                current_part = f"{current_part}{char}"
-                part_cursor += 1
-
-            middle_parts.append(current_part)
-            for middle_part in middle_parts:
-                if middle_part:  # Skip blank strings, we allowed those
-                    formatted_instruction_parts.append(middle_part)
+            if '"' in middle_part or "'" in middle_part:
+                # Collapse the instruction, except the part inside of strings.
+                formatted_instruction_parts.extend(INSTRUCTION_PART_REGEX.findall(middle_part))
+            else:
+                # Without strings, every run of spaces collapses.
+                formatted_instruction_parts.extend(
+                    split_part for split_part in middle_part.split(" ") if split_part
+                )
         else:
             formatted_instruction_parts.append(middle_part.strip())
 
@@ -456,6 +456,20 @@ class BasePreprocessor(ABC):
         self._cursor = self._update_position(cursor, end_cursor)
         self._placeholder_id_num += 1
 
+    def _restore_instruction(self, instructions, inserted_newline_locations, match):
+        """Return the instruction for a placeholder match, if not yet restored.
+
+        Pops the instruction from instructions, and appends the location of
+        each of its newlines to inserted_newline_locations.
+        """
+        placeholder = match.group()
+        instruction = instructions.pop(placeholder, placeholder)
+        if "\n" in instruction:
+            instruction_index = match.start()
+            for newline_match in re.finditer(r"\n", instruction):
+                inserted_newline_locations.append(instruction_index + newline_match.start())
+        return instruction
+
     def _update_position(self, cursor, end_cursor):
         """Update line & column number, and return the new cursor value."""
         len_chunk = end_cursor - cursor
@@ -463,27 +477,25 @@ class BasePreprocessor(ABC):
             return end_cursor
 
         html = self._dynamic_html
-        num_lines = html.count("\n", cursor, end_cursor)
-        self.line += num_lines
-        if num_lines:
-            # Start the column number over
-            self.offset = len_chunk - html[cursor:end_cursor].rindex("\n") - 1
-        else:
+        last_line_break = html.rfind("\n", cursor, end_cursor)
+        if last_line_break < 0:
             # Add the current chunk length to the column number
             self.offset += len_chunk
+        else:
+            # Start the column number over
+            self.line += html.count("\n", cursor, last_line_break + 1)
+            self.offset = end_cursor - last_line_break - 1
 
         return end_cursor
 
     def _log_error(self, rule_code, **kwargs):
-        replacements = {}
-        for keyword, value in kwargs.items():
-            replacements[keyword] = value
+        replacements = kwargs
 
         self.errors.append(
             Error(
                 line=self.line,
                 column=self.offset,
-                rule=Rule.get(rule_code),
+                rule=get_rule(rule_code),
                 replacements=replacements,
             ),
         )
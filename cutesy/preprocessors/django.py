@@ -20,6 +20,36 @@ class Preprocessor(BasePreprocessor):
         "spaceless_json": "endspaceless_json",
     }
 
+    instruction_type_map = {
+        "block": InstructionType.PARTIAL,
+        "endblock": InstructionType.END_PARTIAL,
+        "if": InstructionType.CONDITIONAL,
+        "elif": InstructionType.MID_CONDITIONAL,
+        "else": InstructionType.LAST_CONDITIONAL,
+        "endif": InstructionType.END_CONDITIONAL,
+        "for": InstructionType.REPEATABLE,
+        "endfor": InstructionType.END_REPEATABLE,
+        "while": InstructionType.REPEATABLE,
+        "endwhile": InstructionType.END_REPEATABLE,
+        "with": InstructionType.PARTIAL,
+        "endwith": InstructionType.END_PARTIAL,
+        "blocktrans": InstructionType.CONDITIONAL,
+        "plural": InstructionType.LAST_CONDITIONAL,
+        "endblocktrans": InstructionType.END_CONDITIONAL,
+        "comment": InstructionType.COMMENT,
+        "endcomment": InstructionType.END_COMMENT,
+        "spaceless": InstructionType.FREEFORM,
+        "endspaceless": InstructionType.END_FREEFORM,
+        "spaceless_json": InstructionType.FREEFORM,
+        "endspaceless_json": InstructionType.END_FREEFORM,
+    }
+
+    # Special directive comments allowed specifically for Cutesy
+    comment_instruction_type_map = {
+        "freeform": InstructionType.FREEFORM,
+        "endfreeform": InstructionType.END_FREEFORM,
+    }
+
     def parse_instruction_tag(self, braces, html, cursor, cursor2):
         """Return the appropriate instruction text and InstructionType."""
         if braces[0] == "{{":
@@ -38,44 +68,13 @@ class Preprocessor(BasePreprocessor):
             raise self.make_fatal_error("P4")
 
         if braces[0] == "{#":
-            # Special directive comments allowed specifically for Cutesy
-            special_comment_instructions = {
-                "freeform": InstructionType.FREEFORM,
-                "endfreeform": InstructionType.END_FREEFORM,
-            }
-
-            try:
-                return instruction, special_comment_instructions[instruction]
-            except KeyError:
+            instruction_type = self.comment_instruction_type_map.get(instruction)
+            if instruction_type is None:
                 return "…", InstructionType.IGNORED
+            return instruction, instruction_type
 
-        try:
-            return (
-                instruction,
-                {
-                    "block": InstructionType.PARTIAL,
-                    "endblock": InstructionType.END_PARTIAL,
-                    "if": InstructionType.CONDITIONAL,
-                    "elif": InstructionType.MID_CONDITIONAL,
-                    "else": InstructionType.LAST_CONDITIONAL,
-                    "endif": InstructionType.END_CONDITIONAL,
-                    "for": InstructionType.REPEATABLE,
-                    "endfor": InstructionType.END_REPEATABLE,
-                    "while": InstructionType.REPEATABLE,
-                    "endwhile": InstructionType.END_REPEATABLE,
-                    "with": InstructionType.PARTIAL,
-                    "endwith": InstructionType.END_PARTIAL,
-                    "blocktrans": InstructionType.CONDITIONAL,
-                    "plural": InstructionType.LAST_CONDITIONAL,
-                    "endblocktrans": InstructionType.END_CONDITIONAL,
-                    "comment": InstructionType.COMMENT,
-                    "endcomment": InstructionType.END_COMMENT,
-                    "spaceless": InstructionType.FREEFORM,
-                    "endspaceless": InstructionType.END_FREEFORM,
-                    "spaceless_json": InstructionType.FREEFORM,
-                    "endspaceless_json": InstructionType.END_FREEFORM,
-                }[instruction],
-            )
-        except KeyError:
-            # Unrecognized but valid tags behave like values.
-            return instruction, InstructionType.VALUE
+        # Unrecognized but valid tags behave like values.
+        return (
+            instruction,
+            self.instruction_type_map.get(instruction, InstructionType.VALUE),
+        )
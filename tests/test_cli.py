@@ -0,0 +1,67 @@
+"""Tests for the command line interface."""
+
+# Standard Library
+import os
+
+# Cutesy
+from cutesy import HTMLLinter, cli
+from cutesy.preprocessors import django
+
+
+class TestCLI:
+    """Test the CLI helpers."""
+
+    htmls = (
+        "<!doctype html>\n<html>\n\t<p>Hi</p>\n</html>\n",
+        "<!doctype html>\n<html>\n  <P>Hi</p>\n</html>\n",
+        # Unclosed instruction; Fails to preprocess
+        "<!doctype html>\n{% if x %}\n",
+        # Non-HTML5 doctype; Skipped
+        '<!DOCTYPE html PUBLIC "-//W3C//DTD HTML 4.01//EN">\n<p>Hi</p>\n',
+        "<!doctype html>\n<div>\n\t{% if x %}\n\t\t<p>Hi</p>\n\t{% endif %}\n</div>\n",
+    )
+
+    def test_lint_html(self):
+        """Test the results for failed and skipped HTML."""
+        linter = HTMLLinter(preprocessor=django.Preprocessor())
+
+        _, errors, is_preprocessing_error, is_skipped = cli.lint_html(linter, self.htmls[2])
+        assert errors
+        assert is_preprocessing_error
+        assert not is_skipped
+
+        result, errors, is_preprocessing_error, is_skipped = cli.lint_html(linter, self.htmls[3])
+        assert result is None
+        assert not errors
+        assert not is_preprocessing_error
+        assert is_skipped
+
+    def test_lint_all_html(self, monkeypatch):
+        """Test that linting in parallel matches linting in process."""
+        linter = HTMLLinter(preprocessor=django.Preprocessor())
+
+        # Enough work for two worker processes
+        long_html = "<!doctype html>\n<p>{}</p>\n".format("Hi " * cli.MIN_CHARS_PER_LINT_PROCESS)
+        htmls = [*self.htmls, long_html]
+
+        expected_results = [cli.lint_html(linter, html) for html in htmls]
+
+        monkeypatch.setattr(os, "cpu_count", lambda: 2)
+        assert cli.lint_all_html(linter, htmls) == expected_results
+
+    def test_lint_all_html_in_process(self, monkeypatch):
+        """Test that linting stays in process without enough work or CPUs."""
+        linter = HTMLLinter(preprocessor=django.Preprocessor())
+
+        # Starting worker processes would raise a NameError
+        monkeypatch.delattr(cli, "ProcessPoolExecutor")
+
+        expected_results = [cli.lint_html(linter, html) for html in self.htmls]
+        assert cli.lint_all_html(linter, list(self.htmls)) == expected_results
+
+        long_html = "<!doctype html>\n<p>{}</p>\n".format("Hi " * cli.MIN_CHARS_PER_LINT_PROCESS)
+        monkeypatch.setattr(os, "cpu_count", lambda: 1)
+        assert cli.lint_all_html(linter, [long_html, long_html]) == [
+            cli.lint_html(linter, long_html),
+            cli.lint_html(linter, long_html),
+        ]
@@ -1,7 +1,7 @@
 """Tests for HTMLLinter and related functionality."""
 
 # Cutesy
-from cutesy import HTMLLinter
+from cutesy import HTMLLinter, attr_sort
 from cutesy.preprocessors import django
 
 
@@ -57,3 +57,48 @@ class TestLinter:
 
         assert result == expected_result
         assert not errors
+
+    def test_attr_sort(self):
+        """Test sorting attributes by priority."""
+        names = ["onclick", "data-x", "style", "zzz", "href", "id", "xlink:href", "aria-label"]
+        attrs = sorted([(name, None) for name in names] + [(None, None)], key=attr_sort)
+
+        assert [attr[0] for attr in attrs] == [
+            "id",
+            "href",
+            "xlink:href",
+            "style",
+            "aria-label",
+            "zzz",
+            "data-x",
+            "onclick",
+            None,
+        ]
+
+    def test_instruction_collapse(self):
+        """Test collapsing instructions, except inside of strings."""
+        linter = HTMLLinter(fix=True, preprocessor=django.Preprocessor())
+
+        dynamic_html = "<p>{%  url  'a  b'  x %}</p>"
+        expected_result = "<p>{% url 'a  b' x %}</p>"
+
+        result, errors = linter.lint(dynamic_html)
+        assert result == expected_result
+        assert not errors
+
+        dynamic_html = r'<p>{%  url  "c \" d"  x %}</p>'
+        expected_result = r'<p>{% url "c \" d" x %}</p>'
+
+        result, errors = linter.lint(dynamic_html)
+        assert result == expected_result
+        assert not errors
+
+    def test_preprocessor_delimiters(self):
+        """Test choosing placeholder delimiters which aren't in the HTML."""
+        preprocessor = django.Preprocessor()
+
+        # Every character before the soft hyphen, which is special
+        dynamic_html = "".join(chr(char_num) for char_num in range(161, 173))
+        preprocessor.reset(dynamic_html)
+
+        assert preprocessor.delimiters == (chr(174), chr(175))